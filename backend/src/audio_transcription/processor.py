@@ -10,8 +10,6 @@ from ..audio_processor.audio_processing_pipeline import AudioProcessingPipeline
 from ..audio_processor.config import settings
 from ..transcription.transcription import TranscriptionModule
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -1,5 +1,4 @@
 # backend/src/interview_manager/audio_endpoints.py
-import gc
 import json
 import mimetypes
 import os
@@ -10,7 +9,6 @@ from itertools import chain
 from os.path import basename
 from typing import Optional, List, Dict
 
-import torch
 from dateutil import parser
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, File, UploadFile, Form, Body, Query
@@ -352,13 +350,6 @@ async def transcribe_audio(
             interview.status = "error"
             interview.error_message = str(e)
             db.commit()
-        finally:
-            try:
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                gc.collect()
-            except Exception as cleanup_error:
-                logger.error(f"Error during cleanup: {str(cleanup_error)}")
 
     background_tasks.add_task(transcribe_task, interview_id)
     return interview
@@ -392,17 +383,17 @@ async def generate_answers(interview_id: int, background_tasks: BackgroundTasks,
             if not context:
                 raise Exception("No merged transcription available for the interview.")
 
-            generated_answers = {}
-            total_questions = len(questionnaire.questions)
-            for i, question in enumerate(questionnaire.questions, 1):
-                try:
-                    answer = await question_answerer.answer_question(question, context)
-                    generated_answers[question] = answer
+            # formatted_questions unwraps legacy {'items': [...]} payloads
+            questions = questionnaire.formatted_questions
+            total_questions = len(questions)
 
-                    interview.progress = (i / total_questions) * 100
-                    db.commit()
-                except Exception as e:
-                    generated_answers[question] = f"Error: {str(e)}"
+            async def update_progress(answered: int):
+                interview.progress = (answered / total_questions) * 100
+                db.commit()
+
+            generated_answers = await question_answerer.answer_questions(
+                questions, context, on_answer=update_progress
+            )
 
             interview.generated_answers = json.dumps(generated_answers)
             interview.status = "answered"
@@ -417,8 +408,6 @@ async def generate_answers(interview_id: int, background_tasks: BackgroundTasks,
             interview.status = "error"
             interview.error_message = str(e)
             db.commit()
-        finally:
-            question_answerer.unload_model()
 
     background_tasks.add_task(generate_answers_task, interview_id)
     return {"message": "Answer generation started"}
@@ -5,11 +5,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
-from .database import engine, Base
+from .database import engine, Base, SessionLocal
 from .interview_manager.audio_endpoints import router as interview_manager_router
+from .model_manager.ollama_client import get_ollama_client
+from .question_answerer.question_answerer import question_answerer
 from .questionnaire_manager.api import router as questionnaire_manager_router
+from .questionnaire_manager.crud import normalize_legacy_questionnaires
+from .transcription.transcription import TranscriptionModule
 
+import asyncio
 import logging
+import os
 
 logging.basicConfig(level=logging.INFO)
 
@@ -46,8 +52,41 @@ async def validation_exception_handler(request, exc):
 app.include_router(questionnaire_manager_router, prefix="/api/questionnaires", tags=["questionnaires"])
 app.include_router(interview_manager_router, prefix="/api/interviews", tags=["interviews"])
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+def create_schema():
+    # Without migrations the app creates its own tables; deployments that manage the schema can opt out
+    if os.getenv("AUTO_CREATE_SCHEMA", "1") == "1":
+        Base.metadata.create_all(bind=engine)
+
+
+@app.on_event("startup")
+def normalize_questionnaires():
+    # One-off backfill of legacy question payloads, so reads and answering see plain question lists
+    db = SessionLocal()
+    try:
+        normalized = normalize_legacy_questionnaires(db)
+        if normalized:
+            logging.getLogger(__name__).info(f"Normalized {normalized} legacy questionnaire fields")
+    finally:
+        db.close()
+
+
+@app.on_event("startup")
+async def preload_answer_model():
+    # Warm the model in the background so startup does not wait on the LLM server
+    app.state.preload_task = asyncio.create_task(question_answerer.load_model())
+
+
+@app.on_event("startup")
+async def warm_up_transcription():
+    # Compiling Whisper takes a while; do it in a worker thread before the first file arrives
+    app.state.asr_warmup_task = asyncio.create_task(asyncio.to_thread(TranscriptionModule().warmup))
+
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    await get_ollama_client().aclose()
+
 
 # Add a test route
 @app.get("/api/test")
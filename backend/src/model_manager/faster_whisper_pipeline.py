@@ -0,0 +1,62 @@
+# src/model_manager/faster_whisper_pipeline.py
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FasterWhisperPipeline:
+    """Thin wrapper around faster-whisper exposing the HF ASR pipeline call signature"""
+
+    def __init__(self, model_name: str, device: str = "cuda", compute_type: str = "int8_float16", batch_size: int = 1):
+        from faster_whisper import WhisperModel
+
+        logger.info(f"Loading faster-whisper model {model_name} ({compute_type}) on {device}")
+        self.model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=os.cpu_count() or 0,
+        )
+        self.batch_size = batch_size
+        self.batched = None
+        if batch_size > 1:
+            try:
+                # faster-whisper >= 1.1 decodes VAD-split segments in batches
+                from faster_whisper import BatchedInferencePipeline
+                self.batched = BatchedInferencePipeline(model=self.model)
+            except ImportError:
+                logger.info("BatchedInferencePipeline unavailable, transcribing sequentially")
+
+    def transcribe(self, audio: Any, language: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        """Transcribe audio and return the result in the HF pipeline 'chunks' format"""
+        kwargs.setdefault("vad_filter", True)
+        if self.batched is not None:
+            segments, info = self.batched.transcribe(audio, language=language, batch_size=self.batch_size, **kwargs)
+        else:
+            segments, info = self.model.transcribe(audio, language=language, **kwargs)
+        chunks = [
+            {"timestamp": (segment.start, segment.end), "text": segment.text}
+            for segment in segments
+        ]
+        return {
+            "text": "".join(chunk["text"] for chunk in chunks),
+            "chunks": chunks,
+        }
+
+    def __call__(self, audio: Any, generate_kwargs: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Accept HF pipeline arguments, forwarding only those faster-whisper understands"""
+        generate_kwargs = generate_kwargs or {}
+        options = {}
+        if "num_beams" in generate_kwargs:
+            options["beam_size"] = generate_kwargs["num_beams"]
+        if "temperature" in generate_kwargs:
+            options["temperature"] = generate_kwargs["temperature"]
+        if "no_speech_threshold" in generate_kwargs:
+            options["no_speech_threshold"] = generate_kwargs["no_speech_threshold"]
+        if "logprob_threshold" in generate_kwargs:
+            options["log_prob_threshold"] = generate_kwargs["logprob_threshold"]
+        if "condition_on_prev_tokens" in generate_kwargs:
+            options["condition_on_previous_text"] = generate_kwargs["condition_on_prev_tokens"]
+        return self.transcribe(audio, language=generate_kwargs.get("language"), **options)
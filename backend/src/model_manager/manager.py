@@ -1,17 +1,26 @@
 # src/model_manager/manager.py
+import contextlib
 import gc
+import importlib.util
 import logging
 import os
+import threading
 from typing import Dict, Optional
 
 import torch
 from pyannote.audio import Pipeline as DiarizationPipeline
-from transformers import pipeline
+from transformers import WhisperFeatureExtractor, pipeline
 
-from .ollama_client import OllamaClient, OllamaSettings
+from .ollama_client import get_ollama_client
 
 logger = logging.getLogger(__name__)
 
+# The allocator reads this once, on the first CUDA allocation, so it must be set
+# before anything touches the GPU. Expandable segments let variable-length
+# workloads grow one mapping instead of fragmenting into fixed-size blocks.
+os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True')
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
 
@@ -20,9 +29,14 @@ class ModelSettings(BaseSettings):
     DIARIZATION_MODEL: str = "pyannote/speaker-diarization-3.1"
 
     # ASR settings optimized for full-file processing
-    ASR_BATCH_SIZE: int = 1  # Keep batch size at 1 for full file processing
+    ASR_BATCH_SIZE: int = 0  # 30 s windows decoded together; 0 sizes the batch from free VRAM
     ASR_RETURN_TIMESTAMPS: bool = True
 
+    # ASR backend: "transformers" or "faster_whisper" (CTranslate2, requires the
+    # asr-ctranslate2 extra); languages without a CTranslate2 model use transformers
+    ASR_BACKEND: str = "transformers"
+    ASR_COMPUTE_TYPE: str = "int8_float16"
+
     # Memory optimization
     TORCH_DTYPE: str = "float16"
     DEVICE_MAP: str = "auto"
@@ -34,32 +48,70 @@ class ModelSettings(BaseSettings):
         "cuda:0": "9GB",
     }
 
+    # Keep ASR and diarization loaded between transcriptions instead of reloading them per file
+    KEEP_MODELS_RESIDENT: bool = True
+    # Resident ASR and diarization models are released after this many idle seconds; 0 keeps them forever
+    IDLE_UNLOAD_SECONDS: int = 300
+    # Run diarization and ASR side by side when, with both models loaded, at least
+    # CONCURRENT_MIN_FREE_VRAM_MB is left for their activations; otherwise they run one after
+    # the other. Set CONCURRENT_PIPELINES to false to always run them sequentially
+    CONCURRENT_PIPELINES: bool = True
+    CONCURRENT_MIN_FREE_VRAM_MB: int = 4096
+
     # Diarization settings
     DIARIZATION_MIN_SPEAKERS: int = 1
     DIARIZATION_MAX_SPEAKERS: int = 5
+    # Speaker-embedding crops per forward pass; memory stays constant in the recording length
+    DIARIZATION_EMBEDDING_BATCH_SIZE: int = 32
 
     model_config = {
-        "env_prefix": "MODEL_"
+        "env_prefix": "MODEL_",
+        "frozen": True
     }
 
+    @field_validator('ASR_BACKEND')
+    @classmethod
+    def check_asr_backend_installed(cls, v):
+        # Fail at startup rather than on the first transcription
+        if v == 'faster_whisper' and importlib.util.find_spec('faster_whisper') is None:
+            raise ValueError(
+                "MODEL_ASR_BACKEND=faster_whisper requires the faster-whisper package; "
+                "install the backend with `poetry install --extras asr-ctranslate2`"
+            )
+        return v
+
 
 settings = ModelSettings()
 
+# Resolved once so loaders receive a real dtype rather than its name
+torch_dtype = getattr(torch, settings.TORCH_DTYPE) if torch.cuda.is_available() else torch.float32
+
+
+class DeviceWhisperFeatureExtractor(WhisperFeatureExtractor):
+    """Whisper feature extractor that computes log-mel spectrograms on a fixed device"""
+
+    def __init__(self, *args, device: str = "cpu", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.device = device
+
+    def __call__(self, *args, **kwargs):
+        # The ASR pipeline never passes a device, so the STFT would otherwise always run on the CPU;
+        # features still come back as host arrays for the pipeline to batch
+        kwargs.setdefault("device", self.device)
+        return super().__call__(*args, **kwargs)
+
 
 class ModelManager:
-    _instance = None
     LANGUAGE_MODEL_MAPPING = {
         'gsw': 'nizarmichaud/whisper-large-v3-turbo-swissgerman',
         'default': 'openai/whisper-large-v3'
     }
+    # CTranslate2 conversions available to the faster-whisper backend
+    FASTER_WHISPER_MODEL_MAPPING = {
+        'default': 'large-v3'
+    }
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(ModelManager, cls).__new__(cls)
-            cls._instance._initialize()
-        return cls._instance
-
-    def _initialize(self):
+    def __init__(self):
         """Initialize the model manager with CUDA optimizations"""
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         if torch.cuda.is_available():
@@ -75,19 +127,23 @@ class ModelManager:
 
             # Configure memory management
             torch.cuda.set_per_process_memory_fraction(0.95)
-            os.environ['PYTORCH_CUDA_ALLOC_CONF'] = (
-                'max_split_size_mb:512,'
-                'garbage_collection_threshold:0.8,'
-                'roundup_power2_divisions:4'
-            )
 
         self.models: Dict[str, any] = {}
         self.pipelines: Dict[str, any] = {}
         self.processors: Dict[str, any] = {}
 
-        # Initialize Ollama client
-        self.ollama_settings = OllamaSettings()
-        self.ollama_client = OllamaClient(self.ollama_settings)
+        # One lock per model key, so concurrent callers (startup warmup, requests) load each model once
+        # without a Whisper build holding up diarization
+        self._pipeline_locks = {'asr': threading.RLock(), 'diarization': threading.RLock()}
+
+        # Idle unloading of resident models
+        self._idle_lock = threading.Lock()
+        self._idle_timer: Optional[threading.Timer] = None
+        self._in_flight = 0
+
+        # Share the process-wide Ollama client
+        self.ollama_client = get_ollama_client()
+        self.ollama_settings = self.ollama_client.settings
 
         # Define model configurations
         self.model_configs = {
@@ -95,7 +151,7 @@ class ModelManager:
                 'name': settings.ASR_MODEL,
                 'type': 'asr',
                 'quantization': {
-                    'torch_dtype': settings.TORCH_DTYPE,
+                    'torch_dtype': torch_dtype,
                     'batch_size': settings.ASR_BATCH_SIZE,
                 }
             },
@@ -110,7 +166,7 @@ class ModelManager:
         """Load ASR model with full-file processing configuration"""
         logger.info(f"Starting ASR model loading process for {config['name']}")
         try:
-            from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
+            from transformers import AutoModelForSpeechSeq2Seq
             import torch
 
             hf_token = os.getenv('HF_TOKEN')
@@ -132,20 +188,6 @@ class ModelManager:
             cache_dir = os.getenv('TRANSFORMERS_CACHE', '/root/.cache/huggingface')
             os.makedirs(cache_dir, exist_ok=True)
 
-            # Load processor
-            logger.info(f"Loading processor for {config['name']}")
-            try:
-                processor = AutoProcessor.from_pretrained(
-                    config['name'],
-                    token=hf_token,  # Updated from use_auth_token
-                    cache_dir=cache_dir,
-                    trust_remote_code=True,
-                )
-                logger.info("Processor loaded successfully")
-            except Exception as e:
-                logger.error(f"Failed to load processor: {str(e)}")
-                raise
-
             # Load model
             logger.info(f"Loading model {config['name']}")
             try:
@@ -155,7 +197,7 @@ class ModelManager:
                     cache_dir=cache_dir,
                     trust_remote_code=True,
                     torch_dtype=config['quantization']['torch_dtype'],
-                    device_map="auto",
+                    attn_implementation=self._attn_implementation(),
                     low_cpu_mem_usage=True,
                 )
                 logger.info("Model loaded successfully")
@@ -167,25 +209,25 @@ class ModelManager:
             logger.info(f"Optimizing model for {self.device}")
             model = model.to(self.device)
 
-            if settings.TORCH_COMPILE:
+            if settings.TORCH_COMPILE and self.device.type == 'cuda':
                 logger.info("Compiling model")
                 try:
-                    model = torch.compile(model)
+                    # A static KV cache keeps decoder shapes fixed so each decode
+                    # step replays a captured CUDA graph instead of launching kernels.
+                    # dynamic=False keeps the smaller final batch on its own static graph
+                    # instead of recompiling everything with symbolic shapes
+                    model.generation_config.cache_implementation = "static"
+                    # Reuse compiled kernels from TORCHINDUCTOR_CACHE_DIR across restarts, and leave
+                    # room for one graph per final-batch size before dynamo falls back to eager
+                    import torch._dynamo
+                    import torch._inductor.config
+                    torch._inductor.config.fx_graph_cache = True
+                    torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 64)
+                    model.forward = torch.compile(model.forward, mode="reduce-overhead", dynamic=False)
                     logger.info("Model compilation completed")
                 except Exception as e:
                     logger.warning(f"Model compilation failed, continuing without compilation: {str(e)}")
 
-            # Create pipeline
-            logger.info("Creating ASR pipeline")
-            asr_pipeline = pipeline(
-                "automatic-speech-recognition",
-                model=model,
-                tokenizer=processor.tokenizer,
-                feature_extractor=processor.feature_extractor,
-                batch_size=config['quantization']['batch_size'],
-                return_timestamps=settings.ASR_RETURN_TIMESTAMPS,
-            )
-
             # Log memory usage
             if torch.cuda.is_available():
                 memory_allocated = torch.cuda.memory_allocated() / 1024 ** 2
@@ -193,13 +235,43 @@ class ModelManager:
                 logger.info(f"CUDA memory allocated: {memory_allocated:.2f} MB")
                 logger.info(f"CUDA memory reserved: {memory_reserved:.2f} MB")
 
-            self.processors[config['name']] = processor
-            return asr_pipeline.model
+            return model
 
         except Exception as e:
             logger.error(f"Error in ASR model loading: {str(e)}", exc_info=True)
             raise
 
+    def _asr_batch_size(self) -> int:
+        """Number of 30 s windows to decode together, sized from free VRAM unless configured"""
+        if settings.ASR_BATCH_SIZE > 0:
+            return settings.ASR_BATCH_SIZE
+        if self.device.type != 'cuda':
+            return 1
+        # Roughly 768 MB of activations and KV cache per window for large-v3 in float16 with 2 beams
+        free_memory, _ = torch.cuda.mem_get_info()
+        return max(1, min(24, free_memory // (768 * 1024 ** 2)))
+
+    def _attn_implementation(self) -> str:
+        """Use FlashAttention-2 kernels when installed, otherwise PyTorch's fused SDPA"""
+        if self.device.type == 'cuda' and importlib.util.find_spec('flash_attn') is not None:
+            return "flash_attention_2"
+        return "sdpa"
+
+    def _get_asr_processor(self, config: Dict) -> any:
+        """Get or load the processor (tokenizer and feature extractor) for an ASR model"""
+        if config['name'] not in self.processors:
+            from transformers import AutoProcessor
+
+            logger.info(f"Loading processor for {config['name']}")
+            self.processors[config['name']] = AutoProcessor.from_pretrained(
+                config['name'],
+                token=os.getenv('HF_TOKEN'),
+                cache_dir=os.getenv('TRANSFORMERS_CACHE', '/root/.cache/huggingface'),
+                trust_remote_code=True,
+            )
+            logger.info("Processor loaded successfully")
+        return self.processors[config['name']]
+
     def _load_diarization(self, config: Dict) -> DiarizationPipeline:
         """Load diarization model with optimized settings"""
         logger.info(f"Loading diarization model with config: {config}")
@@ -220,6 +292,7 @@ class ModelManager:
 
             # Move to device and apply settings
             pipeline = pipeline.to(self.device)
+            pipeline.embedding_batch_size = settings.DIARIZATION_EMBEDDING_BATCH_SIZE
 
             logger.info("Diarization pipeline created and configured successfully")
             return pipeline
@@ -238,7 +311,6 @@ class ModelManager:
                     raise ValueError(f"Unknown model key: {model_key}")
 
                 if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
                     memory_before = torch.cuda.memory_allocated()
 
                 if config['type'] == 'asr':
@@ -263,14 +335,39 @@ class ModelManager:
 
     def get_pipeline(self, pipeline_key: str, language: Optional[str] = None) -> Optional[any]:
         """Get or create pipeline for specified key with language support"""
+        if pipeline_key in ['llm_extract', 'llm_answer']:
+            # Returned without locking: async callers on the event loop must never wait on a model build
+            return self.ollama_client
+        lock = self._pipeline_locks.get(pipeline_key)
+        if lock is None:
+            raise ValueError(f"Unknown pipeline key: {pipeline_key}")
+        with lock:
+            return self._get_pipeline(pipeline_key, language)
+
+    def _get_pipeline(self, pipeline_key: str, language: Optional[str] = None) -> Optional[any]:
+        """Look up or build the asr or diarization pipeline; callers hold that key's lock"""
         logger.info(f"Getting pipeline for key: {pipeline_key}")
         try:
-            if pipeline_key in ['llm_extract', 'llm_answer']:
-                return self.ollama_client
-
             if pipeline_key == 'asr':
                 model_name = self._get_asr_model_name(language)
-                pipeline_key = f"{pipeline_key}_{language if language else 'default'}"
+                model_language = language if language in self.LANGUAGE_MODEL_MAPPING else 'default'
+                faster_whisper_model = self.FASTER_WHISPER_MODEL_MAPPING.get(model_language)
+                use_faster_whisper = settings.ASR_BACKEND == 'faster_whisper' and faster_whisper_model
+
+                # Key by model rather than language: languages sharing a checkpoint share one
+                # resident copy, and the language itself is passed per call in generate_kwargs
+                pipeline_key = f"{pipeline_key}_{faster_whisper_model if use_faster_whisper else model_name}"
+
+                if use_faster_whisper:
+                    if pipeline_key not in self.pipelines:
+                        from .faster_whisper_pipeline import FasterWhisperPipeline
+                        self.pipelines[pipeline_key] = FasterWhisperPipeline(
+                            faster_whisper_model,
+                            device=self.device.type,
+                            compute_type=settings.ASR_COMPUTE_TYPE if self.device.type == 'cuda' else 'int8',
+                            batch_size=self._asr_batch_size(),
+                        )
+                    return self.pipelines[pipeline_key]
 
                 if pipeline_key not in self.pipelines:
                     model_config = self.model_configs.get('asr')
@@ -284,15 +381,22 @@ class ModelManager:
                     if model is None:
                         raise RuntimeError(f"Failed to load model for pipeline {pipeline_key}")
 
-                    processor = self.processors[model_config['name']]
+                    processor = self._get_asr_processor(model_config)
+                    feature_extractor = processor.feature_extractor
+                    if self.device.type == 'cuda' and isinstance(feature_extractor, WhisperFeatureExtractor):
+                        # from_dict drops kwargs it has no key for, so pass the device to the constructor
+                        feature_extractor = DeviceWhisperFeatureExtractor(
+                            **feature_extractor.to_dict(), device=str(self.device)
+                        )
                     pipeline_kwargs = {
                         "model": model,
                         "tokenizer": processor.tokenizer,
-                        "feature_extractor": processor.feature_extractor,
+                        "feature_extractor": feature_extractor,
                         "chunk_length_s": 30,
                         "stride_length_s": 2,
-                        "batch_size": 4,
-                        "torch_dtype": torch.float16 if torch.cuda.is_available() else torch.float32,
+                        "batch_size": self._asr_batch_size(),
+                        "torch_dtype": model_config['quantization']['torch_dtype'],
+                        "device": self.device,
                     }
 
                     self.pipelines[pipeline_key] = pipeline(
@@ -303,6 +407,9 @@ class ModelManager:
                 return self.pipelines[pipeline_key]
 
             elif pipeline_key == 'diarization':
+                if pipeline_key in self.pipelines:
+                    return self.pipelines[pipeline_key]
+
                 model_config = self.model_configs.get('diarization')
                 if not model_config:
                     raise ValueError(f"Unknown pipeline key: diarization")
@@ -319,7 +426,9 @@ class ModelManager:
                 )
 
                 # Move pipeline to device
-                self.pipelines[pipeline_key] = diarization_pipeline.to(self.device)
+                diarization_pipeline = diarization_pipeline.to(self.device)
+                diarization_pipeline.embedding_batch_size = settings.DIARIZATION_EMBEDDING_BATCH_SIZE
+                self.pipelines[pipeline_key] = diarization_pipeline
                 logger.info("Diarization pipeline created successfully")
                 return self.pipelines[pipeline_key]
 
@@ -330,6 +439,39 @@ class ModelManager:
             logger.error(f"Error in get_pipeline for {pipeline_key}: {str(e)}", exc_info=True)
             raise
 
+    @contextlib.contextmanager
+    def in_use(self):
+        """Mark the resident models busy so the idle timer cannot unload them mid-request"""
+        with self._idle_lock:
+            self._in_flight += 1
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+        try:
+            yield self
+        finally:
+            with self._idle_lock:
+                self._in_flight -= 1
+                if self._in_flight == 0 and settings.KEEP_MODELS_RESIDENT and settings.IDLE_UNLOAD_SECONDS > 0:
+                    self._idle_timer = threading.Timer(settings.IDLE_UNLOAD_SECONDS, self._unload_idle)
+                    self._idle_timer.daemon = True
+                    self._idle_timer.start()
+
+    def _unload_idle(self):
+        """Timer callback releasing ASR and diarization after a quiet period"""
+        with self._idle_lock:
+            # A request may have started, or started and finished and re-armed a fresh timer,
+            # between this timer firing and taking the lock; only the armed timer may unload
+            if self._in_flight > 0 or self._idle_timer is not threading.current_thread():
+                return
+            self._idle_timer = None
+            logger.info(f"Models idle for {settings.IDLE_UNLOAD_SECONDS} s, unloading")
+            try:
+                self.unload_model('asr')
+                self.unload_model('diarization')
+            except Exception as e:
+                logger.error(f"Error unloading idle models: {str(e)}")
+
     def unload_model(self, model_key: str):
         """Unload a specific model and clear its memory"""
         logger.info(f"Unloading model: {model_key}")
@@ -342,12 +484,13 @@ class ModelManager:
                         model.cpu()
                     del self.models[model_key]
 
-                # Clear from pipelines dict
-                if model_key in self.pipelines:
-                    pipeline = self.pipelines[model_key]
+                # Clear from pipelines dict, including per-model variants such as 'asr_openai/whisper-large-v3'
+                pipeline_keys = [key for key in self.pipelines
+                                 if key == model_key or key.startswith(f"{model_key}_")]
+                for pipeline_key in pipeline_keys:
+                    pipeline = self.pipelines.pop(pipeline_key)
                     if hasattr(pipeline, 'cpu'):
                         pipeline.cpu()
-                    del self.pipelines[model_key]
 
                 # Clear from processors dict
                 if model_key in self.processors:
@@ -359,11 +502,9 @@ class ModelManager:
                 # Force garbage collection
                 gc.collect()
 
-                # Clear CUDA memory if available
+                # Return freed blocks to the driver; with expandable segments this does not fragment
                 if torch.cuda.is_available():
-                    with torch.cuda.device('cuda'):
-                        torch.cuda.empty_cache()
-                        torch.cuda.ipc_collect()
+                    torch.cuda.empty_cache()
                     torch.cuda.reset_peak_memory_stats()
 
                 logger.info(f"Successfully unloaded model: {model_key}")
@@ -375,6 +516,12 @@ class ModelManager:
                     logger.info(f"Current CUDA memory allocated: {memory_allocated:.2f} MB")
                     logger.info(f"Current CUDA memory reserved: {memory_reserved:.2f} MB")
 
+            else:
+                # Ollama holds the weights in its own process; ask it to evict them
+                model = (self.ollama_settings.extract_model if model_key == 'llm_extract'
+                         else self.ollama_settings.answer_model)
+                self.ollama_client.unload_model_sync(model)
+
         except Exception as e:
             logger.error(f"Error unloading model {model_key}: {str(e)}")
             raise
@@ -386,13 +533,8 @@ class ModelManager:
             gc.collect()
 
             if torch.cuda.is_available():
-                # Synchronize all CUDA streams
-                torch.cuda.synchronize()
-
-                # Clear the cache for all devices
-                with torch.cuda.device('cuda'):
-                    torch.cuda.empty_cache()
-                    torch.cuda.ipc_collect()
+                # Return freed blocks to the driver
+                torch.cuda.empty_cache()
 
                 # Reset peak stats
                 torch.cuda.reset_peak_memory_stats()
@@ -422,5 +564,27 @@ class ModelManager:
             raise
 
 
-# Create singleton instance
-model_manager = ModelManager()
+_model_manager: Optional[ModelManager] = None
+_model_manager_lock = threading.Lock()
+
+
+def get_model_manager() -> ModelManager:
+    """Return the process-wide model manager, creating it on first use"""
+    global _model_manager
+    # Double-checked so the warmup thread, the answer preload and transcriptions
+    # racing on the first call still share a single manager and its locks
+    if _model_manager is None:
+        with _model_manager_lock:
+            if _model_manager is None:
+                _model_manager = ModelManager()
+    return _model_manager
+
+
+def _reset_model_manager():
+    """Drop the inherited manager (and its CUDA context) in forked workers"""
+    global _model_manager, _model_manager_lock
+    _model_manager = None
+    _model_manager_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_model_manager)
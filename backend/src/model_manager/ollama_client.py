@@ -1,6 +1,8 @@
 # src/model_manager/ollama_client.py
+import functools
 import logging
-from typing import Optional
+import os
+from typing import Dict, List, Optional, Union
 
 import httpx
 from pydantic_settings import BaseSettings
@@ -10,9 +12,20 @@ logger = logging.getLogger(__name__)
 
 class OllamaSettings(BaseSettings):
     host: str = "http://localhost:11434"
-    extract_model: str = "llama3.2:1b"
-    answer_model: str = "llama3.2"
+    # Weight precision is part of the model name: an Ollama quantization tag, or
+    # with api="openai" the served checkpoint (e.g. an NVFP4 build on Blackwell).
+    # 4-bit K-quants keep the weights of both models around 2.8 GB; the KV cache adds
+    # num_ctx tokens per OLLAMA_NUM_PARALLEL slot on top (see the README's LLM server tuning)
+    extract_model: str = "llama3.2:1b-instruct-q4_K_M"
+    answer_model: str = "llama3.2:3b-instruct-q4_K_M"
     timeout: int = 120
+    keep_alive: str = "30m"
+    num_ctx: int = 16384
+    # Greedy decoding: deterministic answers make the answer cache meaningful
+    temperature: float = 0.0
+    # "ollama", or "openai" for an OpenAI-compatible server such as vLLM
+    # (paged KV cache, continuous batching) listening on the same host
+    api: str = "ollama"
 
     model_config = {
         "env_prefix": "OLLAMA_",
@@ -24,39 +37,92 @@ class OllamaSettings(BaseSettings):
 class OllamaClient:
     def __init__(self, settings: Optional[OllamaSettings] = None):
         self.settings = settings or OllamaSettings()
-        self.client = httpx.Client(timeout=self.settings.timeout)
+        self.client = httpx.AsyncClient(timeout=self.settings.timeout)
         self._models_loaded = set()
+        self._installed_models_checked = False
 
     def _get_url(self, endpoint: str) -> str:
         return f"{self.settings.host}/api/{endpoint}"
 
-    async def generate(self, prompt: str, model: str, system: Optional[str] = None) -> str:
-        """Generate a response using the specified model"""
+    def _options(self) -> Dict[str, Union[int, float]]:
+        """Model options shared by all requests"""
+        # A window large enough for whole transcripts, with the prompt pinned on
+        # context shift, keeps the prefix stable so Ollama reuses its KV cache
+        return {
+            "num_ctx": self.settings.num_ctx,
+            "num_keep": -1,
+            "temperature": self.settings.temperature
+        }
+
+    async def _ensure_models_loaded_cache(self):
+        """Populate the loaded-model cache from the models already installed in Ollama"""
+        if self._installed_models_checked:
+            return
         try:
+            response = await self.client.get(self._get_url("tags"))
+            response.raise_for_status()
+            for installed in response.json().get("models", []):
+                name = installed["name"]
+                self._models_loaded.add(name)
+                if name.endswith(":latest"):
+                    self._models_loaded.add(name[:-len(":latest")])
+            self._installed_models_checked = True
+        except Exception as e:
+            logger.warning(f"Could not list installed Ollama models: {str(e)}")
+
+    async def chat(self, messages: List[Dict[str, str]], model: str, json_output: bool = False) -> str:
+        """Generate a chat response, letting the server apply the model's chat template"""
+        if self.settings.api == "openai":
+            return await self._openai_chat(messages, model, json_output)
+
+        try:
+            await self._ensure_models_loaded_cache()
             if model not in self._models_loaded:
                 await self.load_model(model)
 
             data = {
                 "model": model,
-                "prompt": prompt,
+                "messages": messages,
+                "stream": False,
+                "keep_alive": self.settings.keep_alive,
+                "options": self._options()
+            }
+            if json_output:
+                # Grammar-constrained decoding ends as soon as the top-level object closes
+                data["format"] = "json"
+
+            response = await self.client.post(self._get_url("chat"), json=data)
+            response.raise_for_status()
+            return response.json()["message"]["content"]
+
+        except Exception as e:
+            logger.error(f"Error generating chat response with Ollama: {str(e)}")
+            raise
+
+    async def _openai_chat(self, messages: List[Dict[str, str]], model: str, json_output: bool = False) -> str:
+        """Generate a chat response through an OpenAI-compatible server"""
+        try:
+            data = {
+                "model": model,
+                "messages": messages,
                 "stream": False,
-                "keep_alive": 5  # Model will automatically unload after request
+                "temperature": self.settings.temperature
             }
-            if system:
-                data["system"] = system
+            if json_output:
+                data["response_format"] = {"type": "json_object"}
 
-            response = self.client.post(self._get_url("generate"), json=data)
+            response = await self.client.post(f"{self.settings.host}/v1/chat/completions", json=data)
             response.raise_for_status()
-            return response.json()["response"]
+            return response.json()["choices"][0]["message"]["content"]
 
         except Exception as e:
-            logger.error(f"Error generating response with Ollama: {str(e)}")
+            logger.error(f"Error generating chat response with OpenAI-compatible server: {str(e)}")
             raise
 
     async def load_model(self, model: str):
         """Load a model into Ollama"""
         try:
-            response = self.client.post(self._get_url("pull"), json={"name": model})
+            response = await self.client.post(self._get_url("pull"), json={"name": model})
             response.raise_for_status()
             self._models_loaded.add(model)
             logger.info(f"Successfully loaded model: {model}")
@@ -64,11 +130,56 @@ class OllamaClient:
             logger.error(f"Error loading model {model}: {str(e)}")
             raise
 
-    def __del__(self):
-        """Cleanup when the client is destroyed"""
-        if hasattr(self, 'client'):
-            self.client.close()
+    async def preload_model(self, model: str):
+        """Load a model into Ollama's memory ahead of its first request"""
+        if self.settings.api != "ollama":
+            return
+
+        try:
+            await self._ensure_models_loaded_cache()
+            if model not in self._models_loaded:
+                await self.load_model(model)
+
+            # A generate request without a prompt only loads the model. Sending the same options
+            # as chat sizes its KV cache for num_ctx now, so the first question does not force a reload
+            response = await self.client.post(
+                self._get_url("generate"),
+                json={"model": model, "keep_alive": self.settings.keep_alive, "options": self._options()}
+            )
+            response.raise_for_status()
+            logger.info(f"Successfully preloaded model: {model}")
+        except Exception as e:
+            logger.warning(f"Could not preload model {model}: {str(e)}")
+
+    def unload_model_sync(self, model: str):
+        """Evict a model from Ollama's memory while keeping its weights on disk"""
+        if self.settings.api != "ollama":
+            # Other servers keep their model resident for their whole lifetime
+            return
+
+        try:
+            # Called from synchronous cleanup code, so use a one-off blocking request
+            response = httpx.post(
+                self._get_url("generate"),
+                json={"model": model, "prompt": "", "keep_alive": 0},
+                timeout=self.settings.timeout
+            )
+            response.raise_for_status()
+            logger.info(f"Successfully unloaded model: {model}")
+        except Exception as e:
+            logger.error(f"Error unloading model {model}: {str(e)}")
+            raise
+
+    async def aclose(self):
+        """Close the underlying HTTP client"""
+        await self.client.aclose()
+
+
+@functools.cache
+def get_ollama_client() -> OllamaClient:
+    """Return the process-wide Ollama client, creating it on first use"""
+    return OllamaClient()
 
 
-# Create a singleton instance
-ollama_client = OllamaClient()
+# Forked workers must open their own connections
+os.register_at_fork(after_in_child=get_ollama_client.cache_clear)
@@ -7,10 +7,15 @@ question_answering_messages = [
     },
     {
         "role": "user",
-        "content": """Context: {context}
+        "content": """Context: {context}"""
+    }
+]
 
-Question: {question}
+# Kept separate so the system and context messages stay identical across all
+# questions asked about the same transcript
+question_message = {
+    "role": "user",
+    "content": """Question: {question}
 
 Please answer the question based only on the information provided in the context. If you cannot answer directly, explain why and describe any relevant insights from the context."""
-    }
-]
\ No newline at end of file
+}
\ No newline at end of file
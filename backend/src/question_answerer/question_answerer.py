@@ -1,93 +1,158 @@
 # src/question_answerer/question_answerer.py
-import gc
+import asyncio
+import hashlib
 import logging
-import threading
 import time
+from collections import OrderedDict
 from functools import lru_cache
-from typing import List, Dict
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
 
-from ..model_manager.manager import model_manager
-from .prompt_templates import question_answering_messages
+from ..model_manager.manager import get_model_manager
+from .prompt_templates import question_answering_messages, question_message
 
 logger = logging.getLogger(__name__)
 
 class Settings:
     rate_limit_questions_per_minute: int = 10
+    # Questions in flight at once; Ollama batches them across its parallel slots and queues the rest
+    max_concurrent_questions: int = 4
+    answer_cache_size: int = 100
 
 settings = Settings()
 
+
+# Split once so each question is spliced in without re-parsing the template
+_QUESTION_PREFIX, _, _QUESTION_SUFFIX = question_message['content'].partition("{question}")
+
+
+@lru_cache(maxsize=16)
+def _context_messages(context: str) -> Tuple[Dict[str, str], ...]:
+    """Render the system and context messages once per transcript"""
+    return tuple(
+        {"role": message['role'], "content": message['content'].format(context=context)}
+        if message['role'] == 'user' else message
+        for message in question_answering_messages
+    )
+
+
 class QuestionAnswerer:
     def __init__(self):
-        self.last_request_time = 0
-        self._lock = threading.Lock()
+        self._tokens = float(settings.rate_limit_questions_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._answer_cache: OrderedDict[bytes, str] = OrderedDict()
 
     def _prepare_messages(self, question: str, context: str) -> List[Dict[str, str]]:
         """Prepare messages for the model"""
-        prepared_messages = []
-        for message in question_answering_messages:
-            if message['role'] == 'user':
-                content = message['content'].format(context=context, question=question)
-            else:
-                content = message['content']
-            prepared_messages.append({"role": message['role'], "content": content})
-        return prepared_messages
-
-    @lru_cache(maxsize=100)
+        return [
+            *_context_messages(context),
+            {"role": question_message['role'], "content": _QUESTION_PREFIX + question + _QUESTION_SUFFIX}
+        ]
+
+    @staticmethod
+    def _cache_key(question: str, context: str) -> bytes:
+        """Compact cache key from the whitespace/case-normalized question and the context"""
+        normalized_question = " ".join(question.split()).lower()
+        return hashlib.blake2b(
+            normalized_question.encode() + b"\x00" + context.encode(),
+            digest_size=16
+        ).digest()
+
     async def _cached_answer_question(self, question: str, context: str) -> str:
         """Generate an answer using cache for efficiency"""
+        key = self._cache_key(question, context)
+        if key in self._answer_cache:
+            self._answer_cache.move_to_end(key)
+            return self._answer_cache[key]
+
+        await self._wait_for_rate_limit()
         messages = self._prepare_messages(question, context)
 
         try:
-            pipeline = model_manager.get_pipeline('llm_answer')
+            pipeline = get_model_manager().get_pipeline('llm_answer')
             response = await self._get_model_response(messages, pipeline)
-            return response
         except Exception as e:
             logger.error(f"Error in answering question: {str(e)}")
             raise RuntimeError(f"Error in answering question: {str(e)}")
 
+        self._answer_cache[key] = response
+        if len(self._answer_cache) > settings.answer_cache_size:
+            self._answer_cache.popitem(last=False)
+        return response
+
     async def _get_model_response(self, messages: List[Dict[str, str]], pipeline: any) -> str:
         """Get response from Ollama model"""
-        prompt = self._format_messages(messages)
-        system = messages[0]['content'] if messages[0]['role'] == 'system' else None
-
-        response = await pipeline.generate(
-            prompt=prompt,
-            model=pipeline.settings.answer_model,
-            system=system
+        response = await pipeline.chat(
+            messages=messages,
+            model=pipeline.settings.answer_model
         )
 
         return response.strip()
 
-    def _format_messages(self, messages: List[Dict[str, str]]) -> str:
-        """Format messages for Ollama"""
-        formatted = []
-        for msg in messages:
-            if msg['role'] != 'system':  # System message is handled separately
-                formatted.append(f"{msg['role'].capitalize()}: {msg['content']}")
-        return "\n\n".join(formatted)
+    async def _wait_for_rate_limit(self):
+        """Take a token from the per-minute bucket, waiting for a refill only when it is empty"""
+        async with self._lock:
+            capacity = settings.rate_limit_questions_per_minute
+            refill_rate = capacity / 60
+            now = time.monotonic()
+            self._tokens = min(capacity, self._tokens + (now - self._last_refill) * refill_rate)
+            self._last_refill = now
+            if self._tokens < 1:
+                sleep_time = (1 - self._tokens) / refill_rate
+                logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
+                await asyncio.sleep(sleep_time)
+                self._tokens = 1
+                self._last_refill = time.monotonic()
+            self._tokens -= 1
+
+    async def load_model(self):
+        """Load the answer model so the first question does not wait for it"""
+        pipeline = get_model_manager().get_pipeline('llm_answer')
+        await pipeline.preload_model(pipeline.settings.answer_model)
 
     async def answer_question(self, question: str, context: str) -> str:
         """Main method to get an answer for a question"""
-        with self._lock:
-            # Apply rate limiting
-            current_time = time.time()
-            time_since_last_request = current_time - self.last_request_time
-            if time_since_last_request < 60 / settings.rate_limit_questions_per_minute:
-                sleep_time = 60 / settings.rate_limit_questions_per_minute - time_since_last_request
-                logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-                time.sleep(sleep_time)
-
-            self.last_request_time = time.time()
-            try:
-                return await self._cached_answer_question(question, context)
-            except Exception as e:
-                logger.error(f"Error in answering question: {str(e)}")
-                raise
+        try:
+            return await self._cached_answer_question(question, context)
+        except Exception as e:
+            logger.error(f"Error in answering question: {str(e)}")
+            raise
+
+    async def answer_questions(
+            self,
+            questions: List[str],
+            context: str,
+            on_answer: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> Dict[str, str]:
+        """Answer several questions about the same context concurrently"""
+        semaphore = asyncio.Semaphore(settings.max_concurrent_questions)
+        completed = 0
+
+        async def answer(question: str) -> str:
+            nonlocal completed
+            async with semaphore:
+                try:
+                    result = await self.answer_question(question, context)
+                except Exception as e:
+                    result = f"Error: {str(e)}"
+            completed += 1
+            if on_answer:
+                await on_answer(completed)
+            return result
+
+        if not questions:
+            return {}
+
+        # Answer the first question on its own so the server has the shared system and
+        # context prefix cached before the remaining questions fan out across its slots
+        first_answer = await answer(questions[0])
+        answers = await asyncio.gather(*(answer(question) for question in questions[1:]))
+        return dict(zip(questions, [first_answer, *answers]))
 
     def unload_model(self):
         """Clean up resources"""
         try:
-            model_manager.unload_model('llm_answer')
+            get_model_manager().unload_model('llm_answer')
         except Exception as e:
             logger.error(f"Error unloading model: {str(e)}")
 
@@ -1,21 +1,21 @@
 # backend/src/questionnaire_manager/api.py
+import asyncio
 import datetime
-import io
 import json
-from typing import List
+from typing import BinaryIO, Dict, List, Union
 
 import PyPDF2
 import docx2txt
 from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Form
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas
-from .database import SessionLocal, engine
+from . import crud, schemas
+from .database import SessionLocal
 from .llm_question_extractor import question_extraction
 
 router = APIRouter()
 
-models.Base.metadata.create_all(bind=engine)
+MAX_QUESTIONS_DATA_LENGTH = 1_000_000
 
 def get_db():
     db = SessionLocal()
@@ -24,6 +24,27 @@ def get_db():
     finally:
         db.close()
 
+def _parse_file(file_obj: BinaryIO, file_type: str) -> str:
+    """Extract the text of an uploaded questionnaire file"""
+    if file_type == "docx":
+        return docx2txt.process(file_obj)
+    elif file_type == "pdf":
+        pdf_reader = PyPDF2.PdfReader(file_obj)
+        return "".join(page.extract_text() or "" for page in pdf_reader.pages)
+    elif file_type == "txt":
+        return file_obj.read().decode()
+    else:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+
+def _parse_questions(questions_data: str) -> Union[List[str], Dict[str, List[str]]]:
+    """Parse the submitted questions JSON, rejecting oversized payloads before decoding"""
+    if len(questions_data) > MAX_QUESTIONS_DATA_LENGTH:
+        raise HTTPException(status_code=413, detail="Questions data too large")
+    try:
+        return json.loads(questions_data)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid questions format")
+
 @router.post("/", response_model=schemas.Questionnaire)
 async def create_questionnaire(
         title: str = Form(...),
@@ -38,20 +59,11 @@ async def create_questionnaire(
 
     # Process file if provided
     if file:
-        file_content = await file.read()
-        file_type = file.filename.split(".")[-1].lower()
+        file_type = file.filename.rpartition(".")[2].lower()
         try:
-            if file_type == "docx":
-                content = docx2txt.process(io.BytesIO(file_content))
-            elif file_type == "pdf":
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-                content = ""
-                for page in pdf_reader.pages:
-                    content += page.extract_text()
-            elif file_type == "txt":
-                content = file_content.decode()
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+            # Starlette already spools the upload to a temporary file; parse it in place, off the event loop
+            await file.seek(0)
+            content = await asyncio.to_thread(_parse_file, file.file, file_type)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
@@ -59,10 +71,7 @@ async def create_questionnaire(
         # Determine if this is a question extraction request or a save request
         if questions_data:
             # This is a save request - parse the provided questions
-            try:
-                questions = json.loads(questions_data)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid questions format")
+            questions = _parse_questions(questions_data)
         else:
             # This is an extraction request - extract questions but don't save
             questions = await question_extraction(content)
@@ -144,11 +153,7 @@ async def update_questionnaire(
         questions_data: str = Form(...),  # Add this parameter
         db: Session = Depends(get_db)
 ):
-    try:
-        # Parse the questions data
-        questions = json.loads(questions_data)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid questions format")
+    questions = _parse_questions(questions_data)
 
     db_questionnaire = crud.get_questionnaire(db, questionnaire_id=questionnaire_id)
     if db_questionnaire is None:
@@ -170,9 +175,6 @@ async def update_questionnaire(
 
 @router.delete("/{questionnaire_id}")
 async def delete_questionnaire(questionnaire_id: int, db: Session = Depends(get_db)):
-    questionnaire = db.query(models.Questionnaire).filter(models.Questionnaire.id == questionnaire_id).first()
-    if not questionnaire:
+    if not crud.delete_questionnaire(db, questionnaire_id=questionnaire_id):
         raise HTTPException(status_code=404, detail="Questionnaire not found")
-    db.delete(questionnaire)
-    db.commit()
     return {"message": "Questionnaire deleted successfully"}
\ No newline at end of file
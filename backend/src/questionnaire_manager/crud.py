@@ -1,9 +1,11 @@
 # backend/src/questionnaire_manager/crud.py
 from typing import List, Dict, Union
 
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session, load_only, selectinload
 
 from . import models, schemas
+from ..interview_manager.models import Interview
 
 
 def create_questionnaire(
@@ -31,14 +33,33 @@ def get_questionnaire(db: Session, questionnaire_id: int):
 
 
 def get_questionnaires(db: Session, skip: int = 0, limit: int = 100):
-    questionnaires = db.query(models.Questionnaire).offset(skip).limit(limit).all()
+    # Legacy {'items': [...]} questions and missing updated_at are backfilled at startup
+    return (
+        db.query(models.Questionnaire)
+        .options(selectinload(models.Questionnaire.interviews))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+
+def normalize_legacy_questionnaires(db: Session) -> int:
+    """Rewrite legacy {'items': [...]} questions and missing updated_at values once, in place"""
+    normalized = 0
+    questionnaires = db.query(models.Questionnaire).options(
+        load_only(models.Questionnaire.id, models.Questionnaire.questions)
+    )
     for questionnaire in questionnaires:
         if isinstance(questionnaire.questions, dict) and 'items' in questionnaire.questions:
             questionnaire.questions = questionnaire.questions['items']
-        if questionnaire.updated_at is None:
-            questionnaire.updated_at = questionnaire.created_at
+            normalized += 1
+    normalized += db.execute(
+        update(models.Questionnaire)
+        .where(models.Questionnaire.updated_at.is_(None))
+        .values(updated_at=models.Questionnaire.created_at)
+    ).rowcount
     db.commit()
-    return questionnaires
+    return normalized
 
 
 def update_questionnaire(
@@ -60,9 +81,15 @@ def update_questionnaire(
 
 
 def delete_questionnaire(db: Session, questionnaire_id: int):
-    db_questionnaire = db.query(models.Questionnaire).filter(models.Questionnaire.id == questionnaire_id).first()
-    if db_questionnaire:
-        db.delete(db_questionnaire)
-        db.commit()
-        return True
-    return False
\ No newline at end of file
+    # Bulk statements avoid loading the row's content and questions just to delete it.
+    # Interviews are detached as the ORM delete would have done through the relationship.
+    db.execute(
+        update(Interview)
+        .where(Interview.questionnaire_id == questionnaire_id)
+        .values(questionnaire_id=None)
+    )
+    deleted = db.execute(
+        delete(models.Questionnaire).where(models.Questionnaire.id == questionnaire_id)
+    ).rowcount
+    db.commit()
+    return deleted > 0
\ No newline at end of file
@@ -1,43 +1,43 @@
 # src/questionnaire_manager/llm_question_extractor.py
-import copy
 import json
 import logging
 import re
-from threading import Lock
 from typing import Dict, List
 
 from .prompt_templates import extraction_messages
-from ..model_manager.manager import model_manager
+from ..model_manager.manager import get_model_manager
 
 logger = logging.getLogger(__name__)
 
+# The system message and the instruction before the content are identical on every call, so the
+# LLM server reuses their KV cache; only the content is spliced in, without copying the template
+_EXTRACTION_SYSTEM_MESSAGE = extraction_messages[0]
+_EXTRACTION_PREFIX, _, _EXTRACTION_SUFFIX = extraction_messages[1]["content"].partition("{content}")
 
-class LLMQuestionExtractor:
-    _instance = None
-    _lock = Lock()
+_ITEM_PATTERN = re.compile(r'"item":\s*"([^"]+)"')
 
-    def __new__(cls, force_new=False):
-        if force_new or cls._instance is None:
-            with cls._lock:
-                instance = super(LLMQuestionExtractor, cls).__new__(cls)
-                if not force_new:
-                    cls._instance = instance
-        return cls._instance if not force_new else instance
 
+class LLMQuestionExtractor:
     def _clean_json(self, json_string: str) -> dict:
-        """Extract questions directly from the response using regex"""
+        """Extract questions from the JSON response, falling back to a regex scan"""
         try:
-            # Find all "item": "..." patterns
-            import re
-            pattern = r'"item":\s*"([^"]+)"'
-            matches = re.finditer(pattern, json_string)
-
-            # Extract the questions
-            questions = [match.group(1) for match in matches]
+            # Output is JSON-constrained, so it normally parses in one pass
+            try:
+                extracted_items = json.loads(json_string).get("extracted_items", [])
+                questions = [
+                    entry["item"] for entry in extracted_items
+                    if isinstance(entry, dict) and isinstance(entry.get("item"), str)
+                ]
+            except (json.JSONDecodeError, AttributeError, TypeError):
+                questions = []
+
+            if not questions:
+                # Find all "item": "..." patterns
+                questions = _ITEM_PATTERN.findall(json_string)
 
             # Filter out section headers (items that are only 2-3 words and Title Case)
             questions = [q for q in questions if not (
-                    len(q.split()) <= 3 and q.title() == q
+                    len(q.split(None, 3)) <= 3 and q.title() == q
             )]
 
             return {"items": questions}
@@ -49,55 +49,45 @@ class LLMQuestionExtractor:
     async def _get_model_response(self, messages: List[Dict[str, str]]) -> str:
         """Get response from Ollama model"""
         try:
-            pipeline = model_manager.get_pipeline('llm_extract')
-            prompt = self._format_messages(messages)
-            system = messages[0]['content'] if messages[0]['role'] == 'system' else None
-
-            response = await pipeline.generate(
-                prompt=prompt,
+            pipeline = get_model_manager().get_pipeline('llm_extract')
+            response = await pipeline.chat(
+                messages=messages,
                 model=pipeline.settings.extract_model,
-                system=system
+                json_output=True
             )
 
-            logger.info(f"Model response: {response}")
+            # The raw response can be long; only format it when debug logging is on
+            logger.debug("Model response: %s", response)
             return response.strip()
         except Exception as e:
             logger.error(f"Error in getting model response: {str(e)}")
             raise
 
-    def _format_messages(self, messages: List[Dict[str, str]]) -> str:
-        """Format messages for Ollama"""
-        formatted = []
-        for msg in messages:
-            if msg['role'] != 'system':  # System message is handled separately
-                formatted.append(f"{msg['role'].capitalize()}: {msg['content']}")
-        return "\n\n".join(formatted)
-
     async def extract_questions(self, content: str) -> Dict[str, List[str]]:
         """Extract questions from content using the LLM"""
         try:
             logger.info(f"Extracting questions from content: {content[:100]}...")
-            messages = copy.deepcopy(extraction_messages)
-            messages[1]["content"] = messages[1]["content"].format(content=content)
+            messages = [
+                _EXTRACTION_SYSTEM_MESSAGE,
+                {"role": "user", "content": "".join((_EXTRACTION_PREFIX, content, _EXTRACTION_SUFFIX))}
+            ]
 
             response = await self._get_model_response(messages)
             extracted_json = self._clean_json(response)
 
-            logger.info(f"Extracted questions: {extracted_json}")
+            logger.info(f"Extracted {len(extracted_json['items'])} questions")
+            logger.debug("Extracted questions: %s", extracted_json)
             return extracted_json
         except Exception as e:
             logger.error(f"Error in extracting questions: {str(e)}")
             raise
 
 
+# Create a singleton instance
+question_extractor = LLMQuestionExtractor()
+
+
 async def question_extraction(content: str) -> Dict[str, list]:
     """Main function to extract questions"""
-    try:
-        extractor = LLMQuestionExtractor()
-        return await extractor.extract_questions(content)
-    finally:
-        try:
-            # Use synchronous unload
-            model_manager.unload_model('llm_extract')
-        except Exception as e:
-            logger.error(f"Error unloading model: {str(e)}")
+    # The model stays warm between extractions; Ollama evicts it after keep_alive of idleness
+    return await question_extractor.extract_questions(content)
@@ -1,52 +1,64 @@
 # src/transcription/transcription.py
-import gc
+import contextlib
 import logging
-import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Optional
 
-import librosa
 import numpy as np
 import torch
-from pyannote.core import Segment, Annotation
+from pyannote.core import Annotation
 import torchaudio
 
-from ..model_manager.manager import model_manager
+from ..model_manager.manager import get_model_manager, settings as model_settings
 
 logger = logging.getLogger(__name__)
 
 
 class TranscriptionModule:
-    LANGUAGE_MODELS = {
-        'gsw': 'nizarmichaud/whisper-large-v3-turbo-swissgerman',
-        'default': 'openai/whisper-large-v3'
-    }
+    SAMPLE_RATE = 16000
 
     def __init__(self):
         logger.info("Initializing TranscriptionModule")
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         logger.info(f"Using device: {self.device}")
-        self._setup_cuda_optimizations()
-
-    def _setup_cuda_optimizations(self):
-        if torch.cuda.is_available():
-            logger.info("Setting up CUDA optimizations")
-            try:
-                torch.cuda.amp.autocast(enabled=True, dtype=torch.float16)
-                logger.info("CUDA optimizations setup successfully")
-            except Exception as e:
-                logger.error(f"Error setting up CUDA optimizations: {str(e)}")
-                raise
+
+    def warmup(self):
+        """Load the default ASR pipeline and compile it before the first real file arrives"""
+        if not (model_settings.TORCH_COMPILE and self.device.type == 'cuda'):
+            return
+        try:
+            logger.info("Warming up ASR pipeline")
+            with get_model_manager().in_use() as model_manager:
+                asr_pipeline = model_manager.get_pipeline('asr')
+                # A full batch of silent windows captures the same graph real files replay
+                batch_size = getattr(asr_pipeline, '_batch_size', None) or 1
+                silence = np.zeros(self.SAMPLE_RATE * 30 * batch_size, dtype=np.float32)
+                self._transcribe(asr_pipeline, {"array": silence, "sampling_rate": self.SAMPLE_RATE}, None)
+            logger.info("ASR warmup completed")
+        except Exception as e:
+            logger.warning(f"ASR warmup failed, the first transcription will compile instead: {str(e)}")
 
     def load_audio(self, audio_path: str) -> Dict[str, Any]:
-        """Load audio without resampling"""
+        """Load audio as 16 kHz mono, resampling on the GPU when available"""
         try:
             waveform, sample_rate = torchaudio.load(audio_path)
+            waveform = waveform.to(self.device)
 
-            # Convert to mono if stereo
-            if waveform.shape[0] > 1:
+            # Convert to mono; stereo, the common case, is a single fused add-and-scale
+            if waveform.shape[0] == 2:
+                waveform = (waveform[0:1] + waveform[1:2]).mul_(0.5)
+            elif waveform.shape[0] > 2:
                 waveform = torch.mean(waveform, dim=0, keepdim=True)
 
+            # Whisper and pyannote both expect 16 kHz input
+            if sample_rate != self.SAMPLE_RATE:
+                waveform = torchaudio.functional.resample(waveform, sample_rate, self.SAMPLE_RATE)
+                sample_rate = self.SAMPLE_RATE
+
+            waveform = waveform.cpu()
+
             return {
+                "waveform": waveform,
                 "array": waveform.numpy().squeeze(),
                 "sampling_rate": sample_rate
             }
@@ -59,7 +71,8 @@ class TranscriptionModule:
             audio_path: str,
             min_speakers: Optional[int] = None,
             max_speakers: Optional[int] = None,
-            language: Optional[str] = None
+            language: Optional[str] = None,
+            robust: bool = False
     ) -> List[Dict[str, Any]]:
         try:
             logger.info(f"Starting transcription and diarization for: {audio_path}")
@@ -68,88 +81,144 @@ class TranscriptionModule:
             # Load audio
             audio = self.load_audio(audio_path)
 
-            try:
-                # Run diarization first
-                logger.info("Starting diarization")
-                diarization_pipeline = model_manager.get_pipeline('diarization')
-                with torch.amp.autocast('cuda'):
-                    diarization_result = diarization_pipeline(
-                        audio_path,
-                        min_speakers=min_speakers,
-                        max_speakers=max_speakers,
-                        num_speakers=None
-                    )
-
-                logger.info("Diarization completed successfully")
-
-                # Unload diarization model immediately after use
-                model_manager.unload_model('diarization')
-
-                # Get ASR pipeline
-                logger.info("Starting ASR processing")
-                asr_pipeline = model_manager.get_pipeline('asr', language=language)
-
-                # Configure generation parameters for full-file processing
-                generate_kwargs = {
-                    "max_new_tokens": 224,
-                    "num_beams": 2,
-                    "temperature": 0.0,
-                    "no_speech_threshold": 0.6,
-                    "logprob_threshold": -1.0,
-                    "condition_on_prev_tokens": True,
-                    "return_timestamps": True
-                }
-
-                # Add language parameter if not Swiss German
-                if language and language != 'gsw':
-                    generate_kwargs["language"] = language
-                    generate_kwargs["task"] = "transcribe"
-
-                # Process full file
-                with torch.amp.autocast('cuda'):
-                    asr_result = asr_pipeline(
-                        audio["array"],
-                        batch_size=1,  # Process as single batch
-                        return_timestamps=True,
-                        generate_kwargs=generate_kwargs
-                    )
-
-                logger.info("ASR completed successfully")
-
-                # Process results
-                processed_segments = self._process_results(asr_result, diarization_result)
-                return processed_segments
-
-            finally:
-                # Ensure cleanup happens in the correct order
-                self._cleanup()
+            # Holding the models in use keeps the idle timer from unloading them mid-file
+            with get_model_manager().in_use():
+                try:
+                    concurrent = model_settings.CONCURRENT_PIPELINES
+                    if concurrent:
+                        # Load both pipelines up front so the diarization thread never touches the model manager
+                        diarization_pipeline = get_model_manager().get_pipeline('diarization')
+                        asr_pipeline = get_model_manager().get_pipeline('asr', language=language)
+                        concurrent = self._has_concurrency_headroom()
+
+                    if concurrent:
+                        # Diarization and ASR are independent, so overlap them on separate CUDA streams
+                        with ThreadPoolExecutor(max_workers=1) as executor:
+                            diarization_future = executor.submit(
+                                self._diarize, diarization_pipeline, audio, min_speakers, max_speakers
+                            )
+                            asr_result = self._transcribe(asr_pipeline, audio, language, robust)
+                            diarization_result = diarization_future.result()
+                    else:
+                        # Low-VRAM path: one pipeline running at a time; unless models are kept
+                        # resident, only one is loaded at a time as well
+                        diarization_pipeline = get_model_manager().get_pipeline('diarization')
+                        diarization_result = self._diarize(diarization_pipeline, audio, min_speakers, max_speakers)
+                        del diarization_pipeline
+                        if not model_settings.KEEP_MODELS_RESIDENT:
+                            get_model_manager().unload_model('diarization')
+
+                        asr_pipeline = get_model_manager().get_pipeline('asr', language=language)
+                        asr_result = self._transcribe(asr_pipeline, audio, language, robust)
+
+                    # Process results
+                    processed_segments = self._process_results(asr_result, diarization_result)
+                    return processed_segments
+
+                finally:
+                    # Ensure cleanup happens in the correct order
+                    self._cleanup()
 
         except Exception as e:
             logger.error(f"Error in transcribe_and_diarize: {str(e)}", exc_info=True)
             raise
 
+    def _has_concurrency_headroom(self) -> bool:
+        """Whether enough VRAM is free for ASR and diarization activations to coexist"""
+        if self.device.type != 'cuda':
+            return True
+        free_memory, _ = torch.cuda.mem_get_info()
+        if free_memory < model_settings.CONCURRENT_MIN_FREE_VRAM_MB * 1024**2:
+            logger.info(f"Only {free_memory / 1024**2:.0f} MB VRAM free, running diarization and ASR sequentially")
+            return False
+        return True
+
+    def _stream(self):
+        """A dedicated CUDA stream so concurrent pipelines do not serialize on the default one"""
+        if self.device.type == 'cuda':
+            return torch.cuda.stream(torch.cuda.Stream())
+        return contextlib.nullcontext()
+
+    def _diarize(
+            self,
+            diarization_pipeline: Any,
+            audio: Dict[str, Any],
+            min_speakers: Optional[int],
+            max_speakers: Optional[int]
+    ) -> Annotation:
+        """Run speaker diarization on the in-memory waveform"""
+        logger.info("Starting diarization")
+        with self._stream(), torch.amp.autocast('cuda'):
+            # Diarize the waveform already in memory rather than re-reading and resampling the file
+            diarization_result = diarization_pipeline(
+                {"waveform": audio["waveform"], "sample_rate": audio["sampling_rate"]},
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+                num_speakers=None
+            )
+        logger.info("Diarization completed successfully")
+        return diarization_result
+
+    def _transcribe(
+            self,
+            asr_pipeline: Any,
+            audio: Dict[str, Any],
+            language: Optional[str],
+            robust: bool = False
+    ) -> Dict[str, Any]:
+        """Run Whisper over the full file"""
+        logger.info("Starting ASR processing")
+
+        # Configure generation parameters for full-file processing: single-shot greedy decoding
+        generate_kwargs = {
+            "max_new_tokens": 224,
+            "num_beams": 1,
+            "temperature": 0.0,
+            "no_speech_threshold": 0.6,
+            "logprob_threshold": -1.0,
+            # Windows decode independently so they batch; conditioning chains each on the previous one
+            "condition_on_prev_tokens": False,
+            "return_timestamps": True
+        }
+
+        if robust:
+            # Opt-in: beam search, re-decoding windows that fail the quality thresholds at rising temperatures
+            generate_kwargs["num_beams"] = 2
+            generate_kwargs["condition_on_prev_tokens"] = True
+            generate_kwargs["temperature"] = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+            generate_kwargs["compression_ratio_threshold"] = 2.4
+
+        # Add language parameter if not Swiss German
+        if language and language != 'gsw':
+            generate_kwargs["language"] = language
+            generate_kwargs["task"] = "transcribe"
+
+        # Process full file; the model already holds float16 weights on CUDA, so no autocast
+        with self._stream():
+            asr_result = asr_pipeline(
+                audio["array"],
+                return_timestamps=True,
+                generate_kwargs=generate_kwargs
+            )
+
+        logger.info("ASR completed successfully")
+        return asr_result
+
     def _cleanup(self):
         """Cleanup resources after transcription"""
         try:
-            # Unload models in specific order
-            model_manager.unload_model('asr')
-            model_manager.unload_model('diarization')
-
-            # Force garbage collection
-            gc.collect()
+            if model_settings.KEEP_MODELS_RESIDENT:
+                # Keep the models warm for the next file; only hand cached blocks back under VRAM pressure
+                if torch.cuda.is_available():
+                    free_memory, total_memory = torch.cuda.mem_get_info()
+                    if free_memory < 0.1 * total_memory:
+                        torch.cuda.empty_cache()
+            else:
+                # Unload models in specific order; unload_model releases the cached blocks
+                get_model_manager().unload_model('asr')
+                get_model_manager().unload_model('diarization')
 
             if torch.cuda.is_available():
-                # Synchronize CUDA
-                torch.cuda.synchronize()
-
-                # Clear CUDA cache
-                with torch.cuda.device('cuda'):
-                    torch.cuda.empty_cache()
-                    torch.cuda.ipc_collect()
-
-                # Reset stats
-                torch.cuda.reset_peak_memory_stats()
-
                 # Log memory state
                 memory_allocated = torch.cuda.memory_allocated() / 1024**2
                 memory_reserved = torch.cuda.memory_reserved() / 1024**2
@@ -164,6 +233,12 @@ class TranscriptionModule:
         try:
             processed_segments = []
 
+            turn_starts, turn_ends, turn_speaker_ids, speaker_labels = self._build_speaker_index(diarization_result)
+            max_turn_duration = float((turn_ends - turn_starts).max()) if turn_starts.size else 0.0
+
+            # Keep the well-formed chunks that have text, as one bounds array
+            chunk_bounds = []
+            chunk_texts = []
             for chunk in asr_result['chunks']:
                 if not isinstance(chunk.get('timestamp'), (list, tuple)):
                     continue
@@ -172,38 +247,37 @@ class TranscriptionModule:
                 if not (isinstance(start, (int, float)) and isinstance(end, (int, float)) and end > 0 and start < end):
                     continue
 
-                # Create segment for current chunk
-                current_segment = Segment(start, end)
-
-                # Find overlapping speaker segments using Segment intersection
-                overlapping_segments = []
-                for segment, _, speaker_label in diarization_result.itertracks(yield_label=True):
-                    # Use Segment's built-in intersection method
-                    intersection = current_segment & segment
-                    if intersection:  # If there's an overlap
-                        overlapping_segments.append({
-                            'speaker': speaker_label,
-                            'duration': intersection.duration,
-                            'segment': intersection
-                        })
-
-                # Determine dominant speaker based on overlap
-                if not overlapping_segments:
-                    speaker = "UNKNOWN"
-                else:
-                    # Sort by duration of overlap
-                    overlapping_segments.sort(key=lambda x: x['duration'], reverse=True)
-                    speaker = overlapping_segments[0]['speaker']
-
-                # Add processed segment
                 text = chunk['text'].strip()
                 if text:  # Only add segments that have text
-                    processed_segments.append({
-                        "text": text,
-                        "start": float(start),
-                        "end": float(end),
-                        "speaker": speaker
-                    })
+                    chunk_bounds.append((start, end))
+                    chunk_texts.append(text)
+
+            bounds = np.array(chunk_bounds, dtype=np.float64).reshape(-1, 2)
+
+            # Only turns starting in [start - longest turn, end) can overlap a chunk;
+            # locate those windows for all chunks in two vectorized searches
+            window_starts = np.searchsorted(turn_starts, bounds[:, 0] - max_turn_duration, side='left')
+            window_ends = np.searchsorted(turn_starts, bounds[:, 1], side='left')
+
+            for (start, end), lo, hi, text in zip(bounds.tolist(), window_starts.tolist(),
+                                                  window_ends.tolist(), chunk_texts):
+                overlaps = np.clip(np.minimum(turn_ends[lo:hi], end)
+                                   - np.maximum(turn_starts[lo:hi], start), 0.0, None)
+
+                if len(speaker_labels) == 1:
+                    # Monologues need no vote, only whether any turn overlaps the chunk
+                    speaker = speaker_labels[0] if overlaps.size and overlaps.max() > 0 else "UNKNOWN"
+                else:
+                    # The speaker with the most total overlap wins; ties go to the speaker who talked first
+                    durations = np.bincount(turn_speaker_ids[lo:hi], weights=overlaps, minlength=len(speaker_labels))
+                    speaker = speaker_labels[int(durations.argmax())] if durations.size and durations.max() > 0 else "UNKNOWN"
+
+                processed_segments.append({
+                    "text": text,
+                    "start": start,
+                    "end": end,
+                    "speaker": speaker
+                })
 
             # Sort segments by start time
             processed_segments.sort(key=lambda x: x['start'])
@@ -217,59 +291,72 @@ class TranscriptionModule:
             logger.error(f"Error in _process_results: {str(e)}", exc_info=True)
             raise
 
+    def _build_speaker_index(self, diarization_result: Annotation):
+        """Speaker turns as start, end and speaker-id arrays sorted by start, plus the id-to-label list"""
+        turns = sorted(
+            ((segment.start, segment.end, speaker_label)
+             for segment, _, speaker_label in diarization_result.itertracks(yield_label=True)),
+            key=lambda turn: turn[0]
+        )
+        # Ids follow first appearance, so argmax ties resolve to the earliest speaker
+        speaker_ids: Dict[str, int] = {}
+        for _, _, speaker_label in turns:
+            speaker_ids.setdefault(speaker_label, len(speaker_ids))
+
+        starts = np.array([turn[0] for turn in turns], dtype=np.float64)
+        ends = np.array([turn[1] for turn in turns], dtype=np.float64)
+        spk_ids = np.array([speaker_ids[turn[2]] for turn in turns], dtype=np.intp)
+        return starts, ends, spk_ids, list(speaker_ids)
+
     def _merge_segments(self, segments: List[Dict[str, Any]], max_gap: float = 1.0) -> List[Dict[str, Any]]:
         if not segments:
             return []
 
         merged = []
-        current = segments[0].copy()
         min_segment_duration = 0.5  # Minimum segment duration
 
+        # Track the open run by value and build its dict only when it closes
+        run_start = segments[0]["start"]
+        run_end = segments[0]["end"]
+        run_speaker = segments[0]["speaker"]
+        run_texts = [segments[0]["text"]]
+
         for next_segment in segments[1:]:
-            gap = next_segment["start"] - current["end"]
-            segment_duration = current["end"] - current["start"]
+            gap = next_segment["start"] - run_end
+            segment_duration = run_end - run_start
 
             # Check if current segment is long enough
             if segment_duration < min_segment_duration:
                 # For very short segments, try to merge with next regardless of speaker
                 if gap <= max_gap:
-                    current["text"] += " " + next_segment["text"]
-                    current["end"] = next_segment["end"]
-                    current["speaker"] = next_segment["speaker"]  # Take speaker from longer segment
+                    run_texts.append(next_segment["text"])
+                    run_end = next_segment["end"]
+                    run_speaker = next_segment["speaker"]  # Take speaker from longer segment
                     continue
 
             # Normal merging logic
-            if (current["speaker"] == next_segment["speaker"] and gap <= max_gap):
+            if run_speaker == next_segment["speaker"] and gap <= max_gap:
                 # Merge segments
-                current["text"] += " " + next_segment["text"]
-                current["end"] = next_segment["end"]
+                run_texts.append(next_segment["text"])
+                run_end = next_segment["end"]
             else:
                 # Before adding, check if segment is significant
                 if segment_duration >= min_segment_duration:
-                    merged.append(current)
-                current = next_segment.copy()
+                    merged.append({"text": " ".join(run_texts), "start": run_start, "end": run_end, "speaker": run_speaker})
+                run_start = next_segment["start"]
+                run_end = next_segment["end"]
+                run_speaker = next_segment["speaker"]
+                run_texts = [next_segment["text"]]
 
         # Don't forget the last segment
-        if (current["end"] - current["start"]) >= min_segment_duration:
-            merged.append(current)
+        if (run_end - run_start) >= min_segment_duration:
+            merged.append({"text": " ".join(run_texts), "start": run_start, "end": run_end, "speaker": run_speaker})
 
         return merged
 
     def format_as_transcription(self, segments: List[Dict[str, Any]]) -> str:
         """Format segments into a readable transcription with timestamps"""
-        if not segments:
-            return ""
-
-        formatted_text = []
-        current_speaker = None
-
-        for segment in segments:
-            timestamp = f"[{segment['start']:.1f}s - {segment['end']:.1f}s]"
-            if segment["speaker"] != current_speaker:
-                formatted_text.append(f"\n[{segment['speaker']}] {timestamp}")
-                current_speaker = segment["speaker"]
-            else:
-                formatted_text.append(timestamp)
-            formatted_text.append(segment["text"])
-
-        return " ".join(formatted_text).strip()
+        return "\n\n".join(
+            f"[{segment['speaker']}] [{segment['start']:.1f}s - {segment['end']:.1f}s] {segment['text']}"
+            for segment in segments
+        )
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("pyannote.audio")
+transformers = pytest.importorskip("transformers")
+
+from src.model_manager.manager import DeviceWhisperFeatureExtractor
+
+
+def test_device_survives_construction_from_config():
+    source = transformers.WhisperFeatureExtractor()
+    extractor = DeviceWhisperFeatureExtractor(**source.to_dict(), device="cuda:0")
+
+    assert extractor.device == "cuda:0"
+    assert extractor.feature_size == source.feature_size
+    assert extractor.sampling_rate == source.sampling_rate
+
+
+def test_call_forwards_device(monkeypatch):
+    captured = {}
+
+    def fake_call(self, *args, **kwargs):
+        captured.update(kwargs)
+
+    monkeypatch.setattr(transformers.WhisperFeatureExtractor, "__call__", fake_call)
+    extractor = DeviceWhisperFeatureExtractor(device="cuda:0")
+    extractor([0.0] * 16000, sampling_rate=16000)
+
+    assert captured["device"] == "cuda:0"